@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+benchmark the vectorized metadata functions against the original
+per-row loops, using a synthetic variable catalog
+"""
+
+import argparse
+from time import perf_counter
+import numpy as np
+import pandas as pd
+
+from nhanes.utils import make_long_variable_name
+from nhanes.combine import add_long_variable_names_to_metadata, rename_nhanes_vars
+from nhanes.combine import deduplicate_long_variable_names_within_set
+from nhanes.combine import deduplicate_long_variable_names_across_sets
+from nhanes.combine import get_variable_nonNA_counts
+
+
+# original per-row implementations, kept as reference
+def loop_add_long_variable_names_to_metadata(metadata):
+    for i in metadata.index:
+        metadata.loc[i, 'VariableNameLong'] = make_long_variable_name(metadata.loc[i, 'Label'])
+    return(metadata)
+
+
+def loop_deduplicate_long_variable_names_within_set(variable_df):
+    variable_df = variable_df.query('VariableNameLong != "RespondentSequenceNumber"').copy()
+    variable_counts = variable_df.VariableNameLong.value_counts()
+    repeated_variables = variable_counts[variable_counts > 1]
+    repeated_df = variable_df[variable_df.VariableNameLong.isin(repeated_variables.index)]
+    for ctr, index in enumerate(repeated_df.index):
+        variable_df.loc[index, 'VariableNameLong'] = '%s_%d' % (
+            variable_df.loc[index, 'VariableNameLong'], ctr + 1)
+    return(variable_df)
+
+
+def loop_deduplicate_long_variable_names_across_sets(variable_df):
+    variable_df = variable_df.query('VariableNameLong != "RespondentSequenceNumber"').copy()
+    variable_counts = variable_df.VariableNameLong.value_counts()
+    repeated_variables = variable_counts[variable_counts > 1]
+    repeated_df = variable_df[variable_df.VariableNameLong.isin(repeated_variables.index)]
+    for ctr, index in enumerate(repeated_df.index):
+        variable_df.loc[index, 'VariableNameLong'] = '%s_%s' % (
+            variable_df.loc[index, 'VariableNameLong'],
+            variable_df.loc[index, 'Source'])
+    return(variable_df)
+
+
+def loop_rename_nhanes_vars(nhanes_df, metadata_df):
+    rename_dict = {}
+    for i in metadata_df.index:
+        rename_dict[i] = metadata_df.loc[i, 'VariableNameLong']
+    nhanes_df_renamed = nhanes_df.rename(columns=rename_dict)
+    metadata_df = metadata_df.set_index('VariableNameLong')
+    return((nhanes_df_renamed, metadata_df))
+
+
+def loop_get_variable_nonNA_counts(data_df, metadata_df):
+    for variable in data_df.columns:
+        metadata_df.loc[variable, 'nNonNA'] = data_df[
+            variable].notna().sum()
+    return(metadata_df)
+
+
+def make_synthetic_catalog(n_variables=10000, n_subjects=500, seed=0):
+    # labels drawn from a small vocabulary, so that many long names repeat
+    rng = np.random.default_rng(seed)
+    words = ['blood', 'pressure', "don't", 'total', 'fat-free', 'milk', '2%',
+             'age', 'in', 'of', 'days', 'HDL']
+    sources = rng.choice(['DEMO', 'BMX', 'DR1TOT', 'DR2TOT', 'PBCD', 'HDL'], n_variables)
+    metadata = pd.DataFrame({
+        'Variable': ['V%d' % i for i in range(n_variables)],
+        'Label': [' '.join(rng.choice(words, rng.integers(1, 4)))
+                  for i in range(n_variables)],
+        'Source': sources},
+        index=['V%d_%s' % (i, source) for i, source in enumerate(sources)])
+    metadata.loc[metadata.index[0], 'Label'] = 'Respondent sequence number'
+    data_df = pd.DataFrame(rng.random((n_subjects, n_variables)), columns=metadata.index)
+    data_df = data_df.mask(data_df < 0.3)
+    return((metadata, data_df))
+
+
+def time_function(function, *args):
+    start = perf_counter()
+    result = function(*args)
+    return((result, perf_counter() - start))
+
+
+def run_benchmark(n_variables=10000, n_subjects=500):
+    metadata, data_df = make_synthetic_catalog(n_variables, n_subjects)
+    metadata = loop_add_long_variable_names_to_metadata(metadata.copy())
+    benchmarks = [
+        ('add_long_variable_names_to_metadata',
+         loop_add_long_variable_names_to_metadata,
+         add_long_variable_names_to_metadata, (metadata,)),
+        ('deduplicate_long_variable_names_within_set',
+         loop_deduplicate_long_variable_names_within_set,
+         deduplicate_long_variable_names_within_set, (metadata,)),
+        ('deduplicate_long_variable_names_across_sets',
+         loop_deduplicate_long_variable_names_across_sets,
+         deduplicate_long_variable_names_across_sets, (metadata,)),
+        ('rename_nhanes_vars', loop_rename_nhanes_vars,
+         rename_nhanes_vars, (data_df, metadata)),
+        ('get_variable_nonNA_counts', loop_get_variable_nonNA_counts,
+         get_variable_nonNA_counts, (data_df, metadata))]
+
+    results = []
+    for name, loop_function, function, args in benchmarks:
+        # functions modify metadata in place, so give each its own copy
+        loop_result, loop_time = time_function(
+            loop_function, *[i.copy() for i in args])
+        result, vectorized_time = time_function(
+            function, *[i.copy() for i in args])
+        if isinstance(result, tuple):
+            assert all(i.equals(j) for i, j in zip(loop_result, result)), name
+        else:
+            assert loop_result.equals(result), name
+        results.append((name, loop_time, vectorized_time))
+    return(pd.DataFrame(results, columns=['Function', 'LoopTime', 'VectorizedTime']))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark vectorized metadata construction')
+    parser.add_argument('-n', '--nvariables', type=int, default=10000,
+                        help='number of variables in the synthetic catalog')
+    parser.add_argument('-s', '--nsubjects', type=int, default=500,
+                        help='number of subjects in the synthetic data')
+
+    args = parser.parse_args()
+    print(run_benchmark(args.nvariables, args.nsubjects).to_string(index=False))
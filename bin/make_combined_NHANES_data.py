@@ -19,8 +19,15 @@ import pickle
 import pkg_resources
 
 from nhanes.utils import get_nhanes_year_code_dict, get_source_code_from_filepath
-from nhanes.utils import EmptySectionError, make_long_variable_name
+from nhanes.utils import EmptySectionError
 from nhanes.utils import get_vars_to_keep, get_datasets
+from nhanes.combine import add_long_variable_names_to_metadata, rename_nhanes_vars
+from nhanes.combine import deduplicate_long_variable_names_within_set
+from nhanes.combine import deduplicate_long_variable_names_across_sets
+from nhanes.combine import get_variable_nonNA_counts, recode_nhanes_vars
+from nhanes.combine import save_partitioned_data
+from nhanes.validate import compile_validation_rules, validate_nhanes_data
+from nhanes.validate import check_nhanes_data
 
 
 def download_raw_datafiles(datasets=None,
@@ -139,12 +146,6 @@ def load_raw_NHANES_data(basedir='./',
     return(alldata, metadata)
 
 
-def add_long_variable_names_to_metadata(metadata):
-    for i in metadata.index:
-        metadata.loc[i, 'VariableNameLong'] = make_long_variable_name(metadata.loc[i, 'Label'])
-    return(metadata)
-
-
 def get_metadata_from_xpt(datafile):
     # need to load using xport to get metadata
     with open(datafile, 'rb') as infile:
@@ -232,33 +233,6 @@ def parse_html_variable_section(section, variable_df, variable_code_tables, docf
     return((variable_df, variable_code_tables))
 
 
-# for deduplicating within a single variable set
-def deduplicate_long_variable_names_within_set(variable_df):
-    variable_df = variable_df.query('VariableNameLong != "RespondentSequenceNumber"')
-    variable_counts = variable_df.VariableNameLong.value_counts()
-    repeated_variables = variable_counts[variable_counts > 1]
-    repeated_df = variable_df[variable_df.VariableNameLong.isin(repeated_variables.index)]
-    for ctr, index in enumerate(repeated_df.index):
-        variable_df.loc[index, 'VariableNameLong'] = '%s_%d' % (
-            variable_df.loc[index, 'VariableNameLong'], ctr + 1)
-
-    return(variable_df)
-
-
-# for deduplicating once everything is combined
-def deduplicate_long_variable_names_across_sets(variable_df):
-    variable_df = variable_df.query('VariableNameLong != "RespondentSequenceNumber"')
-    variable_counts = variable_df.VariableNameLong.value_counts()
-    repeated_variables = variable_counts[variable_counts > 1]
-    repeated_df = variable_df[variable_df.VariableNameLong.isin(repeated_variables.index)]
-    for ctr, index in enumerate(repeated_df.index):
-        variable_df.loc[index, 'VariableNameLong'] = '%s_%s' % (
-            variable_df.loc[index, 'VariableNameLong'],
-            variable_df.loc[index, 'Source'])
-
-    return(variable_df)
-
-
 def parse_html_variable_info_section(info):
     infodict = {
         i[0].text.strip(': ').replace(' ', ''): i[1].text.strip()
@@ -270,169 +244,10 @@ def parse_html_variable_info_section(info):
     return(infodict)
 
 
-def recode_to_float_if_possible(value_to_recode):
-    try:
-        return(float(value_to_recode))
-    except ValueError:
-        return(value_to_recode)
-
-
-def recode_nhanes_vars(nhanes_df, metadata, variable_code_tables,
-                       refused_as_na=True, dontknow_as_na=True,
-                       table_length_thresh=20):
-    nhanes_df_recoded = nhanes_df.copy()
-    metadata['Recoded'] = False
-    recode_dict = {}
-    for variable in nhanes_df.columns:
-        variable_shortname = '%s_%s' % (metadata.loc[
-            variable].Variable, metadata.loc[variable].Source)
-        assert variable in metadata.index
-        assert variable_shortname in variable_code_tables
-        table = variable_code_tables[variable_shortname]
-        table = table.loc[~table['Value Description'].str.match('Missing')]
-
-        if table.shape[0] == 1 or table['Value Description'].str.match('Range of Values').any():
-            continue
-        if table['Value Description'].str.match('Value was recorded').any():
-            continue
-        # kludge for certain variables that have many different values
-        if table.shape[0] > table_length_thresh:
-            continue
-
-        recode_dict[variable] = {}
-
-        # some variables include a very small value in place of zero
-        small_values_df = nhanes_df_recoded.query('%s < 1e-6' % variable)
-        if small_values_df.shape[0] > 0:
-            print('recoding zero for', variable)
-            nhanes_df_recoded.loc[small_values_df.index, variable] = 0
-            metadata.loc[variable, 'CustomRecoding'] = 'FloatZero'
-
-        if refused_as_na:  # and nhanes_df[variable].dtype != 'float64':
-            recode_dict[variable], table = replace_val_in_table(
-                'Refused', recode_dict[variable], table)
-
-        if dontknow_as_na:  # and nhanes_df[variable].dtype != 'float64':
-            recode_dict[variable], table = replace_val_in_table(
-                "Don't know", recode_dict[variable], table)
-
-        for table_index in table.index:
-            recoded_value = table.loc[table_index, 'Value Description'].replace(',', '')
-            value_to_recode = table.loc[table_index, 'Code or Value']
-            try:
-                value_to_recode = float(value_to_recode)
-            except ValueError:
-                pass
-            recode_dict[variable][value_to_recode] = recoded_value
-
-        metadata.loc[variable, 'Recoded'] = True
-        nhanes_df_recoded[variable] = nhanes_df_recoded[variable].replace(
-            to_replace=recode_dict[variable])
-
-    nhanes_df_recoded = apply_custom_recoding(nhanes_df_recoded, metadata)
-    return((nhanes_df_recoded, metadata))
-
-
-def apply_custom_recoding(nhanes_df_recoded,
-                          metadata,
-                          recode_yesno=True):
-
-    for variable in nhanes_df_recoded.columns:
-        if recode_yesno and nhanes_df_recoded[variable].isin(['Yes', 'No']).sum() > 0:
-            nhanes_df_recoded[variable] = nhanes_df_recoded[variable].replace(
-                to_replace=yesno_recoder())
-            metadata.loc[variable, 'CustomRecoding'] = 'YesNo'
-
-        # heuristic to find income variables
-        if nhanes_df_recoded[variable].isin(list(income_recoder().keys())).sum() > 0:
-            nhanes_df_recoded[variable] = nhanes_df_recoded[variable].replace(
-                to_replace=income_recoder())
-            metadata.loc[variable, 'CustomRecoding'] = 'Income'
-
-        # depression questionnaire variables
-        if nhanes_df_recoded[variable].isin(['More than half the days']).sum() > 0:
-            nhanes_df_recoded[variable] = nhanes_df_recoded[variable].replace(
-                to_replace=depression_recoder())
-            metadata.loc[variable, 'CustomRecoding'] = 'Depression'
-
-        # frequency variables
-        if nhanes_df_recoded[variable].isin(['A few times a year']).sum() > 0:
-            nhanes_df_recoded[variable] = nhanes_df_recoded[variable].replace(
-                to_replace=howoften_recoder())
-            metadata.loc[variable, 'CustomRecoding'] = 'HowOften'
-
-    return(nhanes_df_recoded)
-
-
-def yesno_recoder():
-    return({'Yes': 1, 'No': 0})
-
-
-def howoften_recoder():
-    return({
-        'Never': 0,
-        'A few times a year': 1,
-        'Monthly': 2,
-        'Weekly': 3,
-        'Daily': 4})
-
-
-def depression_recoder():
-    return({
-        'Not at all': 0,
-        'Several days': 1,
-        'More than half the days': 2,
-        'Nearly every day': 3})
-
-
-def income_recoder():
-    return({
-        '$ 0 to $ 4999': 2000,
-        '$ 5000 to $ 9999': 7500,
-        '$10000 to $14999': 12500,
-        '$15000 to $19999': 17500,
-        '$20000 to $24999': 22500,
-        '$25000 to $34999': 30000,
-        '$35000 to $44999': 40000,
-        '$45000 to $54999': 50000,
-        '$55000 to $64999': 60000,
-        '$65000 to $74999': 70000,
-        '$75000 to $99999': 87500,
-        '$100000 and Over': 100000,
-        'Under $20000': np.nan,
-        '$20000 and Over': np.nan})
-
-
-def replace_val_in_table(value, recode_dict, table, replacement=np.nan):
-    replacement_idx = table['Value Description'] == value
-    if replacement_idx.sum() > 0:
-        replacement_val = table.loc[replacement_idx, 'Code or Value'].iloc[0]
-        replacement_val = recode_to_float_if_possible(replacement_val)
-        recode_dict[replacement_val] = replacement
-        table = table.loc[table['Value Description'] != value]
-    return((recode_dict, table))
-
-
 def remove_extra_variables_from_metadata(data_df, metadata_df):
     return(metadata_df.loc[metadata_df.index.isin(data_df.columns)])
 
 
-def rename_nhanes_vars(nhanes_df, metadata_df):
-    rename_dict = {}
-    for i in metadata_df.index:
-        rename_dict[i] = metadata_df.loc[i, 'VariableNameLong']
-    nhanes_df_renamed = nhanes_df.rename(columns=rename_dict)
-    metadata_df = metadata_df.set_index('VariableNameLong')
-    return((nhanes_df_renamed, metadata_df))
-
-
-def get_variable_nonNA_counts(data_df, metadata_df):
-    for variable in data_df.columns:
-        metadata_df.loc[variable, 'nNonNA'] = data_df[
-            variable].notna().sum()
-    return(metadata_df)
-
-
 def save_combined_data(nhanes_df, metadata, variable_code_tables, year,
                        basedir):
     output_path = os.path.join(basedir, 'combined_data')
@@ -444,6 +259,7 @@ def save_combined_data(nhanes_df, metadata, variable_code_tables, year,
     metadata.to_csv(combined_data_path / str('NHANES_metadata_%s.tsv' % year), sep='\t')
     with open(combined_data_path / str('NHANES_variable_coding_%s.pkl' % year), 'wb') as f:
         pickle.dump(variable_code_tables, f)
+    save_partitioned_data(nhanes_df, metadata, year, combined_data_path)
 
 
 if __name__ == "__main__":
@@ -458,6 +274,8 @@ if __name__ == "__main__":
                         help='json file to specify datasets to include')
     parser.add_argument('-b', '--basedir',
                         help='base directory for data files')
+    parser.add_argument('-s', '--strict', action='store_true',
+                        help='fail if the data do not match the code tables')
 
     args = parser.parse_args()
     print(args)
@@ -480,4 +298,10 @@ if __name__ == "__main__":
 
     metadata = get_variable_nonNA_counts(nhanes_df_recoded, metadata)
 
+    validation_rules = compile_validation_rules(variable_code_tables, metadata)
+    if args.strict:
+        check_nhanes_data(nhanes_df_recoded, validation_rules)
+    else:
+        print(validate_nhanes_data(nhanes_df_recoded, validation_rules))
+
     save_combined_data(nhanes_df_recoded, metadata, variable_code_tables, args.year, args.basedir)
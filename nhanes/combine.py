@@ -0,0 +1,192 @@
+"""
+functions to create combined data from the raw NHANES data files
+"""
+
+import json
+from pathlib import Path
+import numpy as np
+from .utils import make_long_variable_names, recode_to_float_if_possible
+from .utils import yesno_recoder, howoften_recoder, depression_recoder, income_recoder
+from .validate import FLOAT_ZERO_THRESH
+
+
+def add_long_variable_names_to_metadata(metadata):
+    metadata['VariableNameLong'] = make_long_variable_names(metadata['Label']).values
+    return(metadata)
+
+
+# for deduplicating within a single variable set
+def deduplicate_long_variable_names_within_set(variable_df):
+    variable_df = variable_df.query('VariableNameLong != "RespondentSequenceNumber"').copy()
+    repeated = get_repeated_long_variable_names(variable_df)
+    # repeated names are numbered with a single counter across the whole set
+    counter = repeated.cumsum()[repeated].astype(str)
+    variable_df.loc[repeated, 'VariableNameLong'] = \
+        variable_df.loc[repeated, 'VariableNameLong'] + '_' + counter
+
+    return(variable_df)
+
+
+# for deduplicating once everything is combined
+def deduplicate_long_variable_names_across_sets(variable_df):
+    variable_df = variable_df.query('VariableNameLong != "RespondentSequenceNumber"').copy()
+    repeated = get_repeated_long_variable_names(variable_df)
+    variable_df.loc[repeated, 'VariableNameLong'] = \
+        variable_df.loc[repeated, 'VariableNameLong'] + '_' + \
+        variable_df.loc[repeated, 'Source'].astype(str)
+
+    return(variable_df)
+
+
+def get_repeated_long_variable_names(variable_df):
+    # boolean mask of rows whose long name occurs more than once
+    names = variable_df.VariableNameLong
+    return(names.duplicated(keep=False) & names.notna())
+
+
+def rename_nhanes_vars(nhanes_df, metadata_df):
+    rename_dict = metadata_df['VariableNameLong'].to_dict()
+    nhanes_df_renamed = nhanes_df.rename(columns=rename_dict)
+    metadata_df = metadata_df.set_index('VariableNameLong')
+    return((nhanes_df_renamed, metadata_df))
+
+
+def get_variable_nonNA_counts(data_df, metadata_df):
+    nonNA_counts = data_df.notna().sum()
+    missing_variables = nonNA_counts.index[~nonNA_counts.index.isin(metadata_df.index)]
+    if len(missing_variables) > 0:
+        metadata_df = metadata_df.reindex(metadata_df.index.append(missing_variables))
+    metadata_df.loc[nonNA_counts.index, 'nNonNA'] = nonNA_counts.astype(float)
+    return(metadata_df)
+
+
+def recode_nhanes_vars(nhanes_df, metadata, variable_code_tables,
+                       refused_as_na=True, dontknow_as_na=True,
+                       table_length_thresh=20):
+    nhanes_df_recoded = replace_float_zeros(nhanes_df.copy(), metadata)
+    metadata['Recoded'] = False
+    recode_dict = {}
+    for variable in nhanes_df.columns:
+        variable_shortname = '%s_%s' % (metadata.loc[
+            variable].Variable, metadata.loc[variable].Source)
+        assert variable in metadata.index
+        assert variable_shortname in variable_code_tables
+        table = variable_code_tables[variable_shortname]
+        table = table.loc[~table['Value Description'].str.match('Missing')]
+
+        if table.shape[0] == 1 or table['Value Description'].str.match('Range of Values').any():
+            continue
+        if table['Value Description'].str.match('Value was recorded').any():
+            continue
+        # kludge for certain variables that have many different values
+        if table.shape[0] > table_length_thresh:
+            continue
+
+        recode_dict[variable] = {}
+
+        if refused_as_na:  # and nhanes_df[variable].dtype != 'float64':
+            recode_dict[variable], table = replace_val_in_table(
+                'Refused', recode_dict[variable], table)
+
+        if dontknow_as_na:  # and nhanes_df[variable].dtype != 'float64':
+            recode_dict[variable], table = replace_val_in_table(
+                "Don't know", recode_dict[variable], table)
+
+        for table_index in table.index:
+            recoded_value = table.loc[table_index, 'Value Description'].replace(',', '')
+            value_to_recode = table.loc[table_index, 'Code or Value']
+            try:
+                value_to_recode = float(value_to_recode)
+            except ValueError:
+                pass
+            recode_dict[variable][value_to_recode] = recoded_value
+
+        metadata.loc[variable, 'Recoded'] = True
+        nhanes_df_recoded[variable] = nhanes_df_recoded[variable].replace(
+            to_replace=recode_dict[variable])
+
+    nhanes_df_recoded = apply_custom_recoding(nhanes_df_recoded, metadata)
+    return((nhanes_df_recoded, metadata))
+
+
+def replace_float_zeros(nhanes_df, metadata):
+    # pd.read_sas loads zeros as a very small value (5.397605e-79),
+    # in recoded and range variables alike
+    numeric_df = nhanes_df.select_dtypes('number')
+    float_zeros = (numeric_df != 0) & (numeric_df.abs() < FLOAT_ZERO_THRESH)
+    variables = float_zeros.columns[float_zeros.any()]
+    if len(variables) > 0:
+        print('recoding zero for', ', '.join(variables))
+        nhanes_df[variables] = numeric_df[variables].mask(float_zeros[variables], 0)
+        metadata.loc[variables, 'CustomRecoding'] = 'FloatZero'
+    return(nhanes_df)
+
+
+def apply_custom_recoding(nhanes_df_recoded,
+                          metadata,
+                          recode_yesno=True):
+
+    for variable in nhanes_df_recoded.columns:
+        if recode_yesno and nhanes_df_recoded[variable].isin(['Yes', 'No']).sum() > 0:
+            nhanes_df_recoded[variable] = nhanes_df_recoded[variable].replace(
+                to_replace=yesno_recoder())
+            metadata.loc[variable, 'CustomRecoding'] = 'YesNo'
+
+        # heuristic to find income variables
+        if nhanes_df_recoded[variable].isin(list(income_recoder().keys())).sum() > 0:
+            nhanes_df_recoded[variable] = nhanes_df_recoded[variable].replace(
+                to_replace=income_recoder())
+            metadata.loc[variable, 'CustomRecoding'] = 'Income'
+
+        # depression questionnaire variables
+        if nhanes_df_recoded[variable].isin(['More than half the days']).sum() > 0:
+            nhanes_df_recoded[variable] = nhanes_df_recoded[variable].replace(
+                to_replace=depression_recoder())
+            metadata.loc[variable, 'CustomRecoding'] = 'Depression'
+
+        # frequency variables
+        if nhanes_df_recoded[variable].isin(['A few times a year']).sum() > 0:
+            nhanes_df_recoded[variable] = nhanes_df_recoded[variable].replace(
+                to_replace=howoften_recoder())
+            metadata.loc[variable, 'CustomRecoding'] = 'HowOften'
+
+    return(nhanes_df_recoded)
+
+
+def replace_val_in_table(value, recode_dict, table, replacement=np.nan):
+    replacement_idx = table['Value Description'] == value
+    if replacement_idx.sum() > 0:
+        replacement_val = table.loc[replacement_idx, 'Code or Value'].iloc[0]
+        replacement_val = recode_to_float_if_possible(replacement_val)
+        recode_dict[replacement_val] = replacement
+        table = table.loc[table['Value Description'] != value]
+    return((recode_dict, table))
+
+
+def save_partitioned_data(nhanes_df, metadata, year, combined_data_path):
+    # save one data file per source dataset, plus a manifest
+    # listing the variables held in each file
+    combined_data_path = Path(combined_data_path)
+    # every column must go into a partition
+    sources = metadata['Source'].reindex(nhanes_df.columns)
+    if sources.isna().any():
+        raise ValueError('no Source in metadata for variables: %s' % ', '.join(
+            sources.index[sources.isna()]))
+
+    # the partitions are keyed on the index, so it must have a name
+    index_name = nhanes_df.index.name if nhanes_df.index.name is not None else 'SEQN'
+
+    partitions = {}
+    metadata = metadata.loc[metadata.index.isin(nhanes_df.columns)]
+    for source, source_metadata in metadata.groupby('Source', sort=False):
+        partition_file = 'NHANES_data_%s_%s.tsv' % (year, source)
+        variables = list(source_metadata.index)
+        nhanes_df[variables].to_csv(combined_data_path / partition_file, sep='\t',
+                                    index_label=index_name)
+        partitions[source] = {'file': partition_file, 'variables': variables}
+
+    manifest = {'year': year,
+                'index': index_name,
+                'partitions': partitions}
+    with open(combined_data_path / str('NHANES_manifest_%s.json' % year), 'w') as f:
+        json.dump(manifest, f, indent=1)
@@ -2,13 +2,27 @@
 functions to load combined data
 """
 
+import asyncio
+import functools
+import json
+import os
+import pickle
 import pkg_resources
 import pandas as pd
 import webbrowser
+from collections import OrderedDict
 from .utils import get_nhanes_year_code_dict
+from .validate import compile_validation_rules, check_nhanes_data
 
+# maximum number of loaded data frames kept by the async loaders
+ASYNC_CACHE_SIZE = 16
 
-def load_NHANES_data(year='2017-2018', datafile=None):
+_async_cache = OrderedDict()
+_async_inflight = {}
+
+
+def load_NHANES_data(year='2017-2018', datafile=None, columns=None,
+                     strict=False):
     """
     load NHANES data for a specified year from package
 
@@ -16,6 +30,10 @@ def load_NHANES_data(year='2017-2018', datafile=None):
     -----------
     year: string, denotes year code for data
           (default = '2017-2018')
+    columns: list of variable names (or a single name) to load
+             (default: all)
+    strict: if True, validate the data against the variable code tables
+            and raise DataValidationError on any violation
 
     Returns:
     ---------
@@ -24,8 +42,26 @@ def load_NHANES_data(year='2017-2018', datafile=None):
     if datafile is None:
         datafile = pkg_resources.resource_filename(
             'nhanes', 'combined_data/%s/NHANES_data_%s.tsv' % (year, year))
-    return(pd.read_csv(datafile, sep='\t',
-                       index_col=0, low_memory=False))
+    if columns is not None:
+        columns = [columns] if isinstance(columns, str) else list(columns)
+        # the index is the first column, whatever its name
+        index_column = pd.read_csv(datafile, sep='\t', nrows=0).columns[0]
+        data_df = pd.read_csv(datafile, sep='\t', index_col=index_column,
+                              usecols=[index_column] + columns,
+                              low_memory=False)[columns]
+    else:
+        data_df = pd.read_csv(datafile, sep='\t',
+                              index_col=0, low_memory=False)
+    if strict:
+        check_nhanes_data(data_df, _get_validation_rules(year))
+    return(data_df)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_validation_rules(year):
+    # compiled once per year and shared by all strict loads
+    return(compile_validation_rules(
+        load_NHANES_variable_coding(year), load_NHANES_metadata(year)))
 
 
 def load_NHANES_metadata(year='2017-2018', datafile=None):
@@ -48,6 +84,187 @@ def load_NHANES_metadata(year='2017-2018', datafile=None):
                        index_col=0, low_memory=False))
 
 
+def load_NHANES_variable_coding(year='2017-2018', datafile=None):
+    """
+    load the NHANES variable code tables for a specified year from package
+
+    Parameters:
+    -----------
+    year: string, denotes year code for data
+          (default = '2017-2018')
+
+    Returns:
+    ---------
+    a dict of pandas data frames, keyed by <Variable>_<Source>
+    """
+    if datafile is None:
+        datafile = pkg_resources.resource_filename(
+            'nhanes', 'combined_data/%s/NHANES_variable_coding_%s.pkl' % (year, year))
+    with open(datafile, 'rb') as f:
+        return(pickle.load(f))
+
+
+def load_NHANES_manifest(year='2017-2018', datafile=None):
+    """
+    load the manifest of the per-source data partitions for a specified year
+
+    Parameters:
+    -----------
+    year: string, denotes year code for data
+          (default = '2017-2018')
+
+    Returns:
+    ---------
+    a dict with the index name and, for each source dataset, the partition
+    file and the variables it holds
+    """
+    if datafile is None:
+        datafile = pkg_resources.resource_filename(
+            'nhanes', 'combined_data/%s/NHANES_manifest_%s.json' % (year, year))
+    with open(datafile, 'r') as f:
+        return(json.load(f))
+
+
+def load_NHANES_partitioned_data(year='2017-2018', columns=None, sources=None,
+                                 datadir=None):
+    """
+    load NHANES data for a specified year from the per-source partitions
+    - only the partitions holding the requested variables are read
+
+    Parameters:
+    -----------
+    year: string, denotes year code for data
+          (default = '2017-2018')
+    columns: list of variable names to load
+             (default: all variables in the selected sources)
+    sources: list of source datasets to load from, e.g. ['DR1TOT', 'DR2TOT']
+             (default: all sources)
+    datadir: directory containing the partitions and manifest
+
+    Returns:
+    ---------
+    a pandas data frame containing the data, indexed by SEQN
+    """
+    if datadir is None:
+        datadir = pkg_resources.resource_filename(
+            'nhanes', 'combined_data/%s' % year)
+    manifest = load_NHANES_manifest(
+        year, os.path.join(datadir, 'NHANES_manifest_%s.json' % year))
+    partitions = manifest['partitions']
+    if sources is None:
+        sources = list(partitions)
+    missing_sources = [i for i in sources if i not in partitions]
+    if missing_sources:
+        raise KeyError('sources not found in partitions: %s' % ', '.join(
+            missing_sources))
+
+    variable_sources = {variable: source for source in sources
+                        for variable in partitions[source]['variables']}
+    if columns is None:
+        columns = list(variable_sources)
+    missing_columns = [i for i in columns if i not in variable_sources]
+    if missing_columns:
+        raise KeyError('variables not found in partitions: %s' % ', '.join(
+            missing_columns))
+    if not columns:
+        raise ValueError('no variables selected')
+
+    partition_dfs = []
+    for source in dict.fromkeys(variable_sources[i] for i in columns):
+        partition_columns = [i for i in columns if variable_sources[i] == source]
+        partition_dfs.append(pd.read_csv(
+            os.path.join(datadir, partitions[source]['file']), sep='\t',
+            index_col=manifest['index'],
+            usecols=[manifest['index']] + partition_columns,
+            low_memory=False))
+    return(pd.concat(partition_dfs, axis=1)[columns])
+
+
+async def load_NHANES_data_async(year='2017-2018', datafile=None, columns=None,
+                                 strict=False):
+    """
+    asynchronous version of load_NHANES_data
+    - parsing runs in a worker thread, off the event loop
+    - concurrent calls for the same year/columns/strict share a single
+      load, and results are kept in a bounded cache
+
+    Parameters:
+    -----------
+    year: string, denotes year code for data
+          (default = '2017-2018')
+    columns: list of variable names (or a single name) to load
+             (default: all)
+    strict: if True, validate the data against the variable code tables
+            and raise DataValidationError on any violation
+
+    Returns:
+    ---------
+    a pandas data frame containing the data
+    """
+    if isinstance(columns, str):
+        columns = [columns]
+    if columns is not None:
+        columns = tuple(columns)
+    key = ('data', year, datafile, columns, strict)
+    return(await _load_async(key, lambda: load_NHANES_data(
+        year, datafile, None if columns is None else list(columns), strict)))
+
+
+async def load_NHANES_metadata_async(year='2017-2018', datafile=None):
+    """
+    asynchronous version of load_NHANES_metadata
+    - shares the single-flight loading and cache of load_NHANES_data_async
+
+    Parameters:
+    -----------
+    year: string, denotes year code for data
+          (default = '2017-2018')
+
+    Returns:
+    ---------
+    a pandas data frame containing the metadata
+    """
+    key = ('metadata', year, datafile)
+    return(await _load_async(key, lambda: load_NHANES_metadata(year, datafile)))
+
+
+def clear_async_cache():
+    """
+    drop all data frames held by the async loaders
+    """
+    _async_cache.clear()
+
+
+async def _load_async(key, loader):
+    # each caller gets its own copy so that the cached frame stays intact
+    if key in _async_cache:
+        _async_cache.move_to_end(key)
+        return(_async_cache[key].copy())
+
+    loop = asyncio.get_running_loop()
+    inflight = _async_inflight.get(key)
+    if inflight is None or inflight[0] is not loop:
+        future = loop.run_in_executor(None, loader)
+        inflight = (loop, future)
+        _async_inflight[key] = inflight
+        future.add_done_callback(
+            lambda f: _finish_async_load(key, inflight, f))
+    # shield so that a cancelled caller does not cancel the shared load
+    df = await asyncio.shield(inflight[1])
+    return(df.copy())
+
+
+def _finish_async_load(key, inflight, future):
+    if _async_inflight.get(key) is inflight:
+        del _async_inflight[key]
+    if future.cancelled() or future.exception() is not None:
+        return
+    _async_cache[key] = future.result()
+    _async_cache.move_to_end(key)
+    while len(_async_cache) > ASYNC_CACHE_SIZE:
+        _async_cache.popitem(last=False)
+
+
 def open_dataset_page(dataset, year='2017-2018'):
     """
     open the web page describing a particular dataset
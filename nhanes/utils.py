@@ -1,6 +1,8 @@
 import string
 import os
 import json
+import numpy as np
+import pandas as pd
 
 datasets = [
     'HSQ', 'DBQ', 'DLQ', 'HIQ', 'SLQ', 'DPQ', 'SMQRTU',
@@ -78,6 +80,65 @@ class EmptySectionError(Exception):
     pass
 
 
+class DataValidationError(Exception):
+    pass
+
+
 def make_long_variable_name(label):
     return(''.join([i.title() for i in label.translate(
         str.maketrans('', '', string.punctuation)).split(' ')]))
+
+
+def make_long_variable_names(labels):
+    """
+    vectorized version of make_long_variable_name for a series of labels
+    """
+    return(pd.Series(labels).str.translate(
+        str.maketrans('', '', string.punctuation)).str.title().str.replace(
+            ' ', '', regex=False))
+
+
+def recode_to_float_if_possible(value_to_recode):
+    try:
+        return(float(value_to_recode))
+    except ValueError:
+        return(value_to_recode)
+
+
+def yesno_recoder():
+    return({'Yes': 1, 'No': 0})
+
+
+def howoften_recoder():
+    return({
+        'Never': 0,
+        'A few times a year': 1,
+        'Monthly': 2,
+        'Weekly': 3,
+        'Daily': 4})
+
+
+def depression_recoder():
+    return({
+        'Not at all': 0,
+        'Several days': 1,
+        'More than half the days': 2,
+        'Nearly every day': 3})
+
+
+def income_recoder():
+    return({
+        '$ 0 to $ 4999': 2000,
+        '$ 5000 to $ 9999': 7500,
+        '$10000 to $14999': 12500,
+        '$15000 to $19999': 17500,
+        '$20000 to $24999': 22500,
+        '$25000 to $34999': 30000,
+        '$35000 to $44999': 40000,
+        '$45000 to $54999': 50000,
+        '$55000 to $64999': 60000,
+        '$65000 to $74999': 70000,
+        '$75000 to $99999': 87500,
+        '$100000 and Over': 100000,
+        'Under $20000': np.nan,
+        '$20000 and Over': np.nan})
@@ -0,0 +1,212 @@
+"""
+functions to validate combined data against the variable code tables
+"""
+
+import re
+import numpy as np
+import pandas as pd
+from .utils import DataValidationError, recode_to_float_if_possible, yesno_recoder
+from .utils import howoften_recoder, depression_recoder, income_recoder
+
+# code table entries such as "3.2 to 242.6" describe a range of values
+RANGE_PATTERN = re.compile(r'^\s*(-?[\d.]+)\s+to\s+(-?[\d.]+)\s*$')
+
+# SAS transport files store zero as a tiny nonzero float
+FLOAT_ZERO_THRESH = 1e-6
+
+
+def compile_validation_rules(variable_code_tables, metadata=None):
+    """
+    compile the variable code tables into per-column validation rules
+
+    Parameters:
+    -----------
+    variable_code_tables: dict of code tables, keyed by <Variable>_<Source>
+    metadata: metadata data frame with Variable and Source columns,
+              indexed by the column names in the data; if None, the
+              data columns are assumed to be the code table keys
+              - columns flagged in its Recoded column are checked against
+                their recoded values, all others against the raw codes
+
+    Returns:
+    ---------
+    a pandas data frame indexed by column name, with the numeric range
+    (Minimum, Maximum) and the set of AllowedValues for each column
+    - columns whose values are not constrained by their table are omitted
+    """
+    if metadata is None:
+        table_keys = {key: key for key in variable_code_tables}
+    else:
+        table_keys = (metadata['Variable'] + '_' + metadata['Source']).to_dict()
+    if metadata is None or 'Recoded' not in metadata:
+        recoded_columns = set()
+    else:
+        recoded_columns = set(metadata.index[metadata['Recoded'].fillna(False).astype(bool)])
+
+    rules = {}
+    for column, table_key in table_keys.items():
+        if table_key not in variable_code_tables:
+            continue
+        rule = compile_code_table(variable_code_tables[table_key],
+                                  column in recoded_columns)
+        if rule is not None:
+            rules[column] = rule
+    return(pd.DataFrame.from_dict(
+        rules, orient='index', columns=['Minimum', 'Maximum', 'AllowedValues']))
+
+
+def compile_code_table(table, recoded=False):
+    """
+    compile a single code table into (minimum, maximum, allowed values)
+    - if recoded, the allowed values are the forms that recode_nhanes_vars
+      gives the codes; refused and don't know become NA, so they are left out
+    - otherwise, the allowed values are the raw codes
+    """
+    entries = [(str(code), str(description)) for code, description in zip(
+        table['Code or Value'], table['Value Description'])
+        if not str(description).startswith('Missing')]
+    if any(description.startswith('Value was recorded') for code, description in entries):
+        return(None)
+
+    recoders = [yesno_recoder(), howoften_recoder(),
+                depression_recoder(), income_recoder()]
+    minimum, maximum = np.nan, np.nan
+    allowed_values = set()
+    for code, description in entries:
+        value_range = RANGE_PATTERN.match(code)
+        if value_range is not None:
+            minimum = np.fmin(minimum, float(value_range.group(1)))
+            maximum = np.fmax(maximum, float(value_range.group(2)))
+            continue
+        if not recoded:
+            allowed_values.add(recode_to_float_if_possible(code))
+            continue
+        if description in ['Refused', "Don't know"]:
+            continue
+        # recode_nhanes_vars replaces codes by their description
+        description = description.replace(',', '')
+        allowed_values.add(recode_to_float_if_possible(description))
+        for recoder in recoders:
+            if description in recoder and not pd.isna(recoder[description]):
+                allowed_values.add(float(recoder[description]))
+
+    if np.isnan(minimum) and not allowed_values:
+        return(None)
+    return((minimum, maximum, frozenset(allowed_values)))
+
+
+def validate_nhanes_data(data_df, rules, max_examples=5):
+    """
+    check all values in a data frame against compiled validation rules
+
+    Parameters:
+    -----------
+    data_df: data frame to validate
+    rules: data frame returned by compile_validation_rules
+    max_examples: number of offending values to list per violation
+
+    Returns:
+    ---------
+    a pandas data frame with one row per (Variable, Violation), giving the
+    Count of offending values and some Examples; violations are
+    - out_of_range: numeric value outside the documented range
+    - undocumented_value: value that is not a documented code
+    - float_zero: tiny nonzero value standing in for zero
+    - unconstrained: column whose values are not constrained by a code table,
+      either because it has no table or because its table does not list
+      the values, e.g. 'Value was recorded' (Count is non-NA values)
+    """
+    checked = data_df.columns[data_df.columns.isin(rules.index)]
+    numeric_df = data_df[checked].select_dtypes('number')
+    text_df = data_df[checked].drop(columns=numeric_df.columns)
+    allowed_pairs = _get_allowed_pairs(rules)
+
+    # numeric columns are checked as they are, text columns by their
+    # distinct values, so that each string is only converted once
+    values = numeric_df.to_numpy(dtype=float)
+    rows, cols = np.nonzero(~np.isnan(values))
+    numeric_values = values[rows, cols]
+    value_codes, value_uniques = pd.factorize(numeric_values)
+    numeric_violations_df = _check_values(
+        rules, allowed_pairs, rules.index.get_indexer(numeric_df.columns)[cols],
+        value_codes, value_uniques.astype(object), value_uniques)
+
+    value_codes, value_uniques = pd.factorize(text_df.to_numpy(dtype=object).ravel())
+    value_codes = value_codes.reshape(text_df.shape)
+    rows, cols = np.nonzero(value_codes >= 0)
+    text_violations_df = _check_values(
+        rules, allowed_pairs, rules.index.get_indexer(text_df.columns)[cols],
+        value_codes[rows, cols], np.asarray(value_uniques, dtype=object),
+        pd.to_numeric(pd.Series(value_uniques, dtype=object),
+                      errors='coerce').to_numpy(dtype=float))
+
+    violations_df = pd.concat((numeric_violations_df, text_violations_df))
+    report = violations_df.groupby(['Variable', 'Violation'], sort=False).agg(
+        Count=('Value', 'size'),
+        Examples=('Value', lambda values: list(pd.unique(values))[:max_examples]))
+
+    unchecked = data_df.columns[~data_df.columns.isin(rules.index)]
+    if len(unchecked) > 0:
+        unchecked_report = pd.DataFrame({
+            'Variable': unchecked,
+            'Violation': 'unconstrained',
+            'Count': data_df[unchecked].notna().sum().to_numpy(),
+            'Examples': [[] for i in unchecked]}).set_index(['Variable', 'Violation'])
+        report = pd.concat((report, unchecked_report))
+    return(report.reset_index())
+
+
+def _check_values(rules, allowed_pairs, rule_index, value_codes,
+                  value_uniques, numeric_uniques):
+    # values are given as codes into value_uniques; numeric_uniques holds
+    # their numeric form (NaN if not numeric), so that '1' matches code 1
+    numeric_values = numeric_uniques[value_codes]
+    minimum = rules['Minimum'].to_numpy(dtype=float)[rule_index]
+    maximum = rules['Maximum'].to_numpy(dtype=float)[rule_index]
+    with np.errstate(invalid='ignore'):
+        valid = (numeric_values >= minimum) & (numeric_values <= maximum)
+        float_zero = (numeric_values != 0) & (np.abs(numeric_values) < FLOAT_ZERO_THRESH)
+
+    # only values outside the ranges are looked up in the code sets,
+    # once per distinct (column, value) pair
+    candidates = np.flatnonzero(~valid)
+    n_uniques = max(len(value_uniques), 1)
+    pair_codes, pairs = pd.factorize(
+        rule_index[candidates].astype(np.int64) * n_uniques + value_codes[candidates])
+    pair_keys = np.where(np.isnan(numeric_uniques), value_uniques,
+                         numeric_uniques.astype(object))[pairs % n_uniques]
+    pair_allowed = pd.MultiIndex.from_arrays(
+        [pairs // n_uniques, pair_keys]).isin(allowed_pairs)
+    valid[candidates] = pair_allowed[pair_codes]
+
+    bad = np.flatnonzero(float_zero | ~valid)
+    violation = np.where(
+        float_zero[bad], 'float_zero',
+        np.where(~np.isnan(minimum[bad]) & ~np.isnan(numeric_values[bad]),
+                 'out_of_range', 'undocumented_value'))
+    return(pd.DataFrame({
+        'Variable': rules.index.to_numpy()[rule_index[bad]],
+        'Violation': violation,
+        'Value': value_uniques[value_codes[bad]]}))
+
+
+def _get_allowed_pairs(rules):
+    allowed = rules['AllowedValues'].reset_index(drop=True).apply(list).explode().dropna()
+    return(pd.MultiIndex.from_arrays([allowed.index.to_numpy(), allowed.to_numpy()]))
+
+
+def check_nhanes_data(data_df, rules):
+    """
+    validate a data frame and raise DataValidationError on any value
+    that violates the rules; unconstrained columns are allowed
+
+    Returns:
+    ---------
+    the validation report (see validate_nhanes_data)
+    """
+    report = validate_nhanes_data(data_df, rules)
+    violations = report.query('Violation != "unconstrained"')
+    if violations.shape[0] > 0:
+        raise DataValidationError('%d values failed validation:\n%s' % (
+            violations.Count.sum(), violations.to_string(index=False)))
+    return(report)
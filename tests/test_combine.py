@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+from nhanes.load import load_NHANES_data, load_NHANES_metadata
+from nhanes.load import load_NHANES_variable_coding, load_NHANES_partitioned_data
+from nhanes.combine import recode_nhanes_vars, save_partitioned_data
+from nhanes.combine import deduplicate_long_variable_names_within_set
+from nhanes.combine import deduplicate_long_variable_names_across_sets
+from nhanes.combine import get_variable_nonNA_counts
+from nhanes.validate import RANGE_PATTERN, compile_validation_rules, check_nhanes_data
+
+
+def make_metadata():
+    # interleaved repeats, a unique name, a missing name and SEQN
+    return(pd.DataFrame({
+        'VariableNameLong': ['EnergyKcal', 'ProteinGm', 'EnergyKcal', 'AgeInYears',
+                             'ProteinGm', np.nan, 'RespondentSequenceNumber', 'EnergyKcal'],
+        'Source': ['DR1TOT', 'DR1TOT', 'DR2TOT', 'DEMO', 'DR2TOT', 'DEMO', 'DEMO', 'BMX']},
+        index=['V%d' % i for i in range(8)]))
+
+
+# expected outputs are those of the original per-row implementations,
+# see bin/benchmark_combined_metadata.py
+def test_deduplicate_within_set():
+    deduplicated = deduplicate_long_variable_names_within_set(make_metadata())
+    assert list(deduplicated.index) == ['V0', 'V1', 'V2', 'V3', 'V4', 'V5', 'V7']
+    assert deduplicated.VariableNameLong.tolist()[:5] == [
+        'EnergyKcal_1', 'ProteinGm_2', 'EnergyKcal_3', 'AgeInYears', 'ProteinGm_4']
+    assert pd.isna(deduplicated.loc['V5', 'VariableNameLong'])
+    assert deduplicated.loc['V7', 'VariableNameLong'] == 'EnergyKcal_5'
+
+
+def test_deduplicate_across_sets():
+    deduplicated = deduplicate_long_variable_names_across_sets(make_metadata())
+    assert list(deduplicated.index) == ['V0', 'V1', 'V2', 'V3', 'V4', 'V5', 'V7']
+    assert deduplicated.VariableNameLong.tolist()[:5] == [
+        'EnergyKcal_DR1TOT', 'ProteinGm_DR1TOT', 'EnergyKcal_DR2TOT',
+        'AgeInYears', 'ProteinGm_DR2TOT']
+    assert pd.isna(deduplicated.loc['V5', 'VariableNameLong'])
+    assert deduplicated.loc['V7', 'VariableNameLong'] == 'EnergyKcal_BMX'
+
+
+def test_get_variable_nonNA_counts():
+    data_df = pd.DataFrame({
+        'V0': [1.0, np.nan, 3.0], 'V3': [np.nan, np.nan, np.nan],
+        'V1': ['a', 'b', None], 'Extra': [1.0, 2.0, 3.0]})
+    counts = get_variable_nonNA_counts(data_df, make_metadata())
+    # variables missing from the metadata are appended
+    assert list(counts.index) == ['V%d' % i for i in range(8)] + ['Extra']
+    assert counts.nNonNA.dtype == float
+    assert counts.nNonNA[['V0', 'V1', 'V3', 'Extra']].tolist() == [2.0, 2.0, 0.0, 3.0]
+    assert counts.nNonNA.drop(['V0', 'V1', 'V3', 'Extra']).isna().all()
+
+
+def make_raw_data(metadata, variable_code_tables, n_subjects=200, seed=0):
+    # draw codes and range values from the code tables, with zeros stored
+    # as pd.read_sas does
+    rng = np.random.default_rng(seed)
+    data = {}
+    for variable in metadata.index:
+        table = variable_code_tables['%s_%s' % (
+            metadata.loc[variable, 'Variable'], metadata.loc[variable, 'Source'])]
+        values = []
+        for code in table['Code or Value'].astype(str):
+            value_range = RANGE_PATTERN.match(code)
+            if value_range is not None:
+                values += list(rng.uniform(float(value_range.group(1)),
+                                           float(value_range.group(2)), 10))
+                values.append(float(value_range.group(1)))
+            elif code != '.':
+                try:
+                    values.append(float(code))
+                except ValueError:
+                    pass
+        if not values:
+            values = list(rng.random(10))
+        data[variable] = rng.choice(values, n_subjects)
+    data_df = pd.DataFrame(data, index=pd.Index(
+        np.arange(93703.0, 93703.0 + n_subjects), name='SEQN'))
+    return(data_df.mask(data_df == 0, 5.397605e-79))
+
+
+def test_recoded_data_validates(tmp_path):
+    metadata = load_NHANES_metadata(year='2017-2018')
+    variable_code_tables = load_NHANES_variable_coding(year='2017-2018')
+    data_df = make_raw_data(metadata, variable_code_tables)
+    recoded_df, metadata = recode_nhanes_vars(
+        data_df, metadata.copy(), variable_code_tables)
+    assert metadata.loc['AgeInYearsAtScreening', 'CustomRecoding'] == 'FloatZero'
+    assert metadata.loc['AlcoholGm_DR1TOT', 'CustomRecoding'] == 'FloatZero'
+
+    rules = compile_validation_rules(variable_code_tables, metadata)
+    check_nhanes_data(recoded_df, rules)
+    # values must also validate after the round trip through the data file
+    recoded_df.to_csv(tmp_path / 'NHANES_data.tsv', sep='\t')
+    load_NHANES_data(datafile=tmp_path / 'NHANES_data.tsv', strict=True)
+
+
+def test_save_partitioned_data(tmp_path):
+    metadata = load_NHANES_metadata(year='2017-2018')
+    variable_code_tables = load_NHANES_variable_coding(year='2017-2018')
+    data_df, metadata = recode_nhanes_vars(
+        make_raw_data(metadata, variable_code_tables), metadata.copy(),
+        variable_code_tables)
+    data_df.to_csv(tmp_path / 'NHANES_data_2017-2018.tsv', sep='\t')
+    save_partitioned_data(data_df, metadata, '2017-2018', tmp_path)
+
+    full_df = load_NHANES_data(datafile=tmp_path / 'NHANES_data_2017-2018.tsv')
+    partitioned_df = load_NHANES_partitioned_data(year='2017-2018', datadir=tmp_path)
+    pd.testing.assert_frame_equal(partitioned_df[full_df.columns], full_df)
+    dietary_df = load_NHANES_partitioned_data(
+        year='2017-2018', sources=['DR1TOT', 'DR2TOT'], datadir=tmp_path)
+    assert set(dietary_df.columns) == set(
+        metadata.index[metadata.Source.isin(['DR1TOT', 'DR2TOT'])])
+    pd.testing.assert_frame_equal(dietary_df, full_df[dietary_df.columns])
+
+    # an unnamed index is written as SEQN
+    save_partitioned_data(data_df.rename_axis(None), metadata, '2017-2018', tmp_path)
+    partitioned_df = load_NHANES_partitioned_data(year='2017-2018', datadir=tmp_path)
+    assert partitioned_df.index.name == 'SEQN'
+    pd.testing.assert_frame_equal(partitioned_df[full_df.columns], full_df)
+
+    # columns without a Source would be left out of every partition
+    with pytest.raises(ValueError):
+        save_partitioned_data(data_df, metadata.drop('WeightKg'), '2017-2018', tmp_path)
+    metadata.loc['WeightKg', 'Source'] = np.nan
+    with pytest.raises(ValueError):
+        save_partitioned_data(data_df, metadata, '2017-2018', tmp_path)
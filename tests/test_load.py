@@ -1,4 +1,13 @@
+import asyncio
+import json
+import pandas as pd
+import pytest
+import nhanes.load
 from nhanes.load import load_NHANES_data, load_NHANES_metadata
+from nhanes.load import load_NHANES_metadata_async, clear_async_cache
+from nhanes.load import load_NHANES_data_async
+from nhanes.utils import DataValidationError
+from nhanes.load import load_NHANES_partitioned_data
 
 
 def test_load_data():
@@ -19,3 +28,135 @@ def test_match():
     # make sure column names in data match index in metadata exactly
     assert not set(data_df.columns).difference(metadata_df.index)
     assert not set(metadata_df.index).difference(data_df.columns)
+
+
+def test_load_metadata_async():
+    clear_async_cache()
+    df = asyncio.run(load_NHANES_metadata_async(year='2017-2018'))
+    assert df.equals(load_NHANES_metadata(year='2017-2018'))
+
+
+def test_async_single_flight(monkeypatch):
+    clear_async_cache()
+    calls = []
+
+    def counting_loader(year='2017-2018', datafile=None):
+        calls.append(year)
+        return(load_NHANES_metadata(year, datafile))
+    monkeypatch.setattr(nhanes.load, 'load_NHANES_metadata', counting_loader)
+
+    async def load_many():
+        return(await asyncio.gather(
+            *[load_NHANES_metadata_async(year='2017-2018') for i in range(5)]))
+
+    results = asyncio.run(load_many())
+    assert len(calls) == 1
+    assert all(df.equals(results[0]) for df in results)
+    # later requests are served from the cache
+    asyncio.run(load_NHANES_metadata_async(year='2017-2018'))
+    assert len(calls) == 1
+    clear_async_cache()
+
+
+def write_test_datafile(tmp_path, index_name='SEQN'):
+    data_df = pd.DataFrame({'WeightKg': [70.0, 80.0], 'Gender': [1, 2],
+                            'DirectHdlcholesterolMgdl': [52.0, 47.0]},
+                           index=pd.Index([93703.0, 93704.0], name=index_name))
+    data_df.to_csv(tmp_path / 'NHANES_data.tsv', sep='\t')
+    return(str(tmp_path / 'NHANES_data.tsv'))
+
+
+def test_load_data_columns(tmp_path):
+    datafile = write_test_datafile(tmp_path)
+    df = load_NHANES_data(datafile=datafile, columns=['DirectHdlcholesterolMgdl', 'WeightKg'])
+    assert list(df.columns) == ['DirectHdlcholesterolMgdl', 'WeightKg']
+    assert df.index.name == 'SEQN'
+    assert df.loc[93704.0, 'WeightKg'] == 80.0
+    df = load_NHANES_data(datafile=datafile, columns='Gender')
+    assert list(df.columns) == ['Gender']
+    # the index column does not need to be called SEQN
+    datafile = write_test_datafile(tmp_path, index_name='Respondent')
+    df = load_NHANES_data(datafile=datafile, columns=['Gender'])
+    assert df.index.name == 'Respondent'
+    assert list(df.columns) == ['Gender']
+
+
+def test_load_data_async_columns(tmp_path, monkeypatch):
+    clear_async_cache()
+    datafile = write_test_datafile(tmp_path)
+    calls = []
+    load_data = nhanes.load.load_NHANES_data
+
+    def counting_loader(*args, **kwargs):
+        calls.append(args)
+        return(load_data(*args, **kwargs))
+    monkeypatch.setattr(nhanes.load, 'load_NHANES_data', counting_loader)
+
+    async def load_many():
+        return(await asyncio.gather(*[load_NHANES_data_async(
+            datafile=datafile, columns=['Gender', 'WeightKg']) for i in range(5)]))
+
+    results = asyncio.run(load_many())
+    assert len(calls) == 1
+    assert all(list(df.columns) == ['Gender', 'WeightKg'] for df in results)
+    # each caller gets its own copy
+    results[0].loc[93703.0, 'WeightKg'] = -1
+    assert results[1].loc[93703.0, 'WeightKg'] == 70.0
+    df = asyncio.run(load_NHANES_data_async(datafile=datafile, columns=['Gender', 'WeightKg']))
+    assert len(calls) == 1
+    assert df.loc[93703.0, 'WeightKg'] == 70.0
+    clear_async_cache()
+
+
+def test_load_data_async_strict(tmp_path):
+    clear_async_cache()
+    data_df = pd.DataFrame({'WeightKg': [70.0, 1000.0]},
+                           index=pd.Index([93703.0, 93704.0], name='SEQN'))
+    data_df.to_csv(tmp_path / 'NHANES_data.tsv', sep='\t')
+    datafile = str(tmp_path / 'NHANES_data.tsv')
+    df = asyncio.run(load_NHANES_data_async(datafile=datafile))
+    assert df.shape == (2, 1)
+    # the non-strict result is cached separately and not reused
+    with pytest.raises(DataValidationError):
+        asyncio.run(load_NHANES_data_async(datafile=datafile, strict=True))
+    # validation rules are compiled once per year
+    nhanes.load._get_validation_rules.cache_clear()
+    for i in range(2):
+        with pytest.raises(DataValidationError):
+            load_NHANES_data(datafile=datafile, strict=True)
+    assert nhanes.load._get_validation_rules.cache_info().misses == 1
+    clear_async_cache()
+
+
+def test_load_partitioned_data(tmp_path):
+    seqn = pd.Index([93703.0, 93704.0, 93705.0], name='SEQN')
+    partitions = {
+        'DEMO': pd.DataFrame({'Gender': [1, 2, 1], 'AgeInYearsAtScreening': [2, 3, 66]},
+                             index=seqn),
+        'HDL': pd.DataFrame({'DirectHdlcholesterolMgdl': [None, 52.0, 47.0]}, index=seqn)}
+    manifest = {'year': '2017-2018', 'index': 'SEQN', 'partitions': {}}
+    for source, df in partitions.items():
+        partition_file = 'NHANES_data_2017-2018_%s.tsv' % source
+        df.to_csv(tmp_path / partition_file, sep='\t')
+        manifest['partitions'][source] = {'file': partition_file,
+                                          'variables': list(df.columns)}
+    with open(tmp_path / 'NHANES_manifest_2017-2018.json', 'w') as f:
+        json.dump(manifest, f)
+
+    df = load_NHANES_partitioned_data(datadir=tmp_path)
+    assert list(df.columns) == ['Gender', 'AgeInYearsAtScreening', 'DirectHdlcholesterolMgdl']
+    assert df.shape[0] == 3
+    df = load_NHANES_partitioned_data(
+        datadir=tmp_path, columns=['DirectHdlcholesterolMgdl', 'Gender'])
+    assert df.loc[93704.0, 'DirectHdlcholesterolMgdl'] == 52.0
+    assert list(df.columns) == ['DirectHdlcholesterolMgdl', 'Gender']
+    df = load_NHANES_partitioned_data(datadir=tmp_path, sources=['HDL'])
+    assert list(df.columns) == ['DirectHdlcholesterolMgdl']
+    with pytest.raises(KeyError):
+        load_NHANES_partitioned_data(datadir=tmp_path, columns=['Nonexistent'])
+    with pytest.raises(KeyError):
+        load_NHANES_partitioned_data(datadir=tmp_path, sources=['XYZ'])
+    with pytest.raises(ValueError):
+        load_NHANES_partitioned_data(datadir=tmp_path, columns=[])
+    with pytest.raises(ValueError):
+        load_NHANES_partitioned_data(datadir=tmp_path, sources=[])
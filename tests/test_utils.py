@@ -0,0 +1,8 @@
+from nhanes.load import load_NHANES_metadata
+from nhanes.utils import make_long_variable_name, make_long_variable_names
+
+
+def test_make_long_variable_names():
+    labels = load_NHANES_metadata(year='2017-2018')['Label']
+    long_names = make_long_variable_names(labels)
+    assert list(long_names) == [make_long_variable_name(i) for i in labels]
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from nhanes.load import load_NHANES_metadata, load_NHANES_variable_coding
+from nhanes.utils import DataValidationError
+from nhanes.validate import compile_validation_rules, validate_nhanes_data
+from nhanes.validate import check_nhanes_data
+
+
+@pytest.fixture(scope='module')
+def rules():
+    return(compile_validation_rules(
+        load_NHANES_variable_coding(year='2017-2018'),
+        load_NHANES_metadata(year='2017-2018')))
+
+
+def test_compile_rules(rules):
+    assert rules.loc['WeightKg', 'Minimum'] == 3.2
+    assert rules.loc['WeightKg', 'Maximum'] == 242.6
+    # recoded columns allow only the recoded values
+    allowed_values = rules.loc['GeneralHealthCondition', 'AllowedValues']
+    assert {'Excellent', 'Very good', 'Fair or', 'Poor?'} <= allowed_values
+    assert not {1.0, 9.0, 'Refused', "Don't know"} & allowed_values
+    assert rules.loc['EverBreastfedOrFedBreastmilk', 'AllowedValues'] == {'Yes', 'No', 1.0, 0.0}
+    # other columns allow only the raw codes
+    assert rules.loc['TypeOfMilkFirstFed2Milk', 'AllowedValues'] == {11.0}
+
+
+def test_validate_unrecoded_codes(rules):
+    data_df = pd.DataFrame({
+        'GeneralHealthCondition': ['Excellent', 1.0, 'Refused'],
+        'EverBreastfedOrFedBreastmilk': [1.0, 0.0, 2.0],
+        'TypeOfMilkFirstFed2Milk': [11.0, np.nan, '2% fat or reduced-fat milk']})
+    report = validate_nhanes_data(data_df, rules).set_index(['Variable', 'Violation'])
+    assert report.shape[0] == 3
+    assert report.loc[('GeneralHealthCondition', 'undocumented_value'), 'Examples'] == [
+        1.0, 'Refused']
+    assert report.loc[('EverBreastfedOrFedBreastmilk', 'undocumented_value'), 'Examples'] == [2.0]
+    assert report.loc[('TypeOfMilkFirstFed2Milk', 'undocumented_value'), 'Count'] == 1
+
+
+def test_validate_data(rules):
+    data_df = pd.DataFrame({
+        'WeightKg': [70.0, 1000.0, 5.397605e-79, np.nan],
+        'GeneralHealthCondition': ['Excellent', 'Good', 'Splendid', np.nan],
+        'UsualSleepTimeOnWeekdaysOrWorkdays': ['22:00', np.nan, np.nan, np.nan]})
+    report = validate_nhanes_data(data_df, rules).set_index(['Variable', 'Violation'])
+    assert report.shape[0] == 4
+    assert report.loc[('WeightKg', 'out_of_range'), 'Examples'] == [1000.0]
+    assert report.loc[('WeightKg', 'float_zero'), 'Count'] == 1
+    assert report.loc[('GeneralHealthCondition', 'undocumented_value'), 'Examples'] == ['Splendid']
+    assert report.loc[('UsualSleepTimeOnWeekdaysOrWorkdays', 'unconstrained'), 'Count'] == 1
+
+    with pytest.raises(DataValidationError):
+        check_nhanes_data(data_df, rules)
+    check_nhanes_data(data_df.iloc[[0, 3]], rules)